@@ -1,7 +1,7 @@
 #!/usr/bin/env python
 # coding: utf-8
 from __future__ import print_function # Anticipating the PY3 apocalypse in 2020
-import sys, argparse, csv, re, platform # For basic file IO stuff, argument parsing, config file reading, text substitution/ regex, OS identification
+import sys, argparse, csv, re, platform, copy # For basic file IO stuff, argument parsing, config file reading, text substitution/ regex, OS identification, colormap copying
 from pdb import set_trace as br #For debugging I prefer the c style "break" nomenclature to "trace"
 import time as time_lib # for diagnostices
 import six
@@ -17,7 +17,7 @@ start_time = time_lib.time()
 parser = argparse.ArgumentParser(description="Plot variables from XDMF with matplotlib")
 group=parser.add_mutually_exclusive_group(required=True)
 parser.add_argument('--quiet','-q',dest='quiet',action='store_const',const=True, help='only display error messages (default full debug messages)')
-group.add_argument('--settings','-s',dest='settingsfile',help='A settings file full of plotting options')
+group.add_argument('--settings','-s',dest='settingsfile',action='append',help='A settings file full of plotting options. Repeat the flag to render every frame once per settings file while only loading the frame data once')
 group.add_argument('--tree',help='Display layout of available data as found in XDMF and exit',action='store_true',default=False)
 group.add_argument('--vars',help='Display full paths to all valid variables and exit',action='store_true',default=False)
 parser.add_argument('--threads','-t',dest='threads', help='number of threads to use for parallel operations')
@@ -162,15 +162,18 @@ print_help()#print_help does a hacky help flag overload by intercepting the sys.
 args=parser.parse_args()
 
 #display help for just the config parser if "help" or "h" appears after -s or --settings
-if args.settingsfile and args.settingsfile in ['help','h']:
+if args.settingsfile and ('help' in args.settingsfile or 'h' in args.settingsfile):
 	settings_parser.print_help()
 	sys.exit()
 
 # Define parsed settings
 argslist=[i[1:] for i in settings_parser.__dict__['_option_string_actions'].keys()] #generate list of valid arguments to prepend '•' to if it's not the first char
-if args.settingsfile and args.settingsfile!='':
+settings_list=[] # (settings file name, parsed settings) for every -s flag given
+for settingsfile in args.settingsfile or []:
+	if settingsfile=='':
+		continue
 	settingsargs=[]
-	for super_arg in csv.reader(open(args.settingsfile).read().split('\n'),delimiter=' ',quotechar='"',escapechar='\\'):
+	for super_arg in csv.reader(open(settingsfile).read().split('\n'),delimiter=' ',quotechar='"',escapechar='\\'):
 		if not filter(None,super_arg) or super_arg[0][0]+super_arg[0][1]=='//': #implement commenting and avoid empty lines
 			continue 
 		for arg in filter(None,super_arg):
@@ -179,8 +182,18 @@ if args.settingsfile and args.settingsfile!='':
 				settingsargs.append(u'•'+arg) 
 			else:
 				settingsargs.append(arg)
-	settings=settings_parser.parse_args(settingsargs)
+	settings_list.append((settingsfile,settings_parser.parse_args(settingsargs)))
 del argslist
+# When several settings files are given, images are tagged with the settings file name (without path or extension) so renders
+# of one frame don't overwrite each other. If two files would give the same tag, prefix every tag with its -s position instead
+if len(settings_list)>1:
+	tags=[re.search('(?!.*\/).*',settingsfile).group().rsplit('.',1)[0] for settingsfile,settings in settings_list]
+	if len(set(tags))<len(tags):
+		tags=[str(n+1)+'_'+tag for n,tag in enumerate(tags)]
+	settings_list=[(tag+'_',settings) for tag,(settingsfile,settings) in zip(tags,settings_list)]
+	del tags
+else:
+	settings_list=[('',settings) for settingsfile,settings in settings_list]
 
 if args.tree or args.vars:
 	args.quiet=True
@@ -259,8 +272,15 @@ def list_vars():
 		for var in valid_variables(grid):
 			print(grid+'/'+var)
 
-for file in args.files:
-	domain=et.parse(file).getroot()[0]
+# Every frame is rendered once per settings file. The jobs are ordered frame by frame so that the xdmf tree,
+# the hdf5 reads and the meshes built from them are loaded once per frame into frame_cache and shared by its renders
+jobs=[(file,variant,settings) for file in args.files for variant,settings in (settings_list or [(None,None)])]
+loaded_file=None
+for file,variant,settings in jobs:
+	if file!=loaded_file:
+		domain=et.parse(file).getroot()[0]
+		frame_cache={}
+		loaded_file=file
 	
 	if args.tree:
 		tree()
@@ -289,9 +309,9 @@ for file in args.files:
 	# Note:
 	# '(?!.*\/).*' is regex to find all the parts of a path prior to the file name
 	if settings.image_name:
-		image_name = settings.image_name+'_'+re.search('(?!.*\/).*',file).group()[:-4]+'.'+settings.image_format
+		image_name = settings.image_name+'_'+variant+re.search('(?!.*\/).*',file).group()[:-4]+'.'+settings.image_format
 	else:
-		image_name = re.search('(?!.*\/).*',TrueVarname).group().title()+'_'+re.search('(?!.*\/).*',file).group()[:-4]+'.'+settings.image_format
+		image_name = re.search('(?!.*\/).*',TrueVarname).group().title()+'_'+variant+re.search('(?!.*\/).*',file).group()[:-4]+'.'+settings.image_format
 	coordinates=[]
 	def get_coordinates( ):
 		expected_dim=grid.find('Topology').get('NumberOfElements').split()
@@ -339,49 +359,55 @@ for file in args.files:
 			else:
 				coordinates.append(hf[coordpath.split(':')[1]][ssc['start']:end:ssc['stride']])
 
-	try:
-		grid = domain.find('*[@Name="'+gridname+'"]')
-		get_coordinates()
-		zeniths=coordinates[0]
-		azimuths=coordinates[1]
-	except AttributeError:
-		eprint('Error: Invalid grid')
-		eprint('\t'+settings.variable+' provided a grid not found in the XDMF')
-		eprint('\tGrid tried was: '+gridname)
-		sys.exit()
-	rad, phi = np.meshgrid(zeniths, azimuths)
-	x,y=pol2cart(rad,phi)
-	try:
-		attrib_elements=domain.find("*[@Name='"+gridname+"']/*[@Name='"+varname+"']/").getchildren()
-		datapath=attrib_elements[1].text.split(':')[1]
-	except AttributeError:
-		eprint("Error: Invalid attribute")
-		eprint("\t"+settings.variable+" not found in "+file)
-		eprint("\tPath looked for was: "+gridname+"/"+varname)
-		sys.exit()
-	if attrib_elements[0].get('Dimensions'):
-		ssc=[]
-		arrsize=int(attrib_elements[0].get('Dimensions').split()[1])
-		for i in range(0,3):
-			a=[]
-			for j in range(0,arrsize):
-				a.append(int(attrib_elements[0].text.split()[j+arrsize*i]))
-			ssc.append(a)
-	else:
-		eprint('Error: Dimensions spec of dataitem in hyperslab invalid ')
-		sys.exit()
-	start=[]
-	stride=[]
-	end=[]
-	for i,j,k in zip(ssc[0],ssc[1],ssc[2]): 
-		start.append(i)
-		stride.append(j)
-		end.append(i+j*k)
-	if re.search('xn_c',datapath): # in case it's abundance stuff and needs an extra dimension specified for the xn_c grid
-		variable=hf[datapath][start[0]:end[0]:stride[0],start[1]:end[1]:stride[1],start[2]:end[2]:stride[2],start[3]:end[3]:stride[3]]
-	else:
-		variable=hf[datapath][start[0]:end[0]:stride[0],start[1]:end[1]:stride[1],start[2]:end[2]:stride[2]]
-	variable=variable.squeeze() #remove dimensions of size 1 so the result is a 2d array
+	if ('grid',gridname) not in frame_cache:
+		try:
+			grid = domain.find('*[@Name="'+gridname+'"]')
+			get_coordinates()
+			zeniths=coordinates[0]
+			azimuths=coordinates[1]
+		except AttributeError:
+			eprint('Error: Invalid grid')
+			eprint('\t'+settings.variable+' provided a grid not found in the XDMF')
+			eprint('\tGrid tried was: '+gridname)
+			sys.exit()
+		rad, phi = np.meshgrid(zeniths, azimuths)
+		x,y=pol2cart(rad,phi)
+		frame_cache[('grid',gridname)]=(hf,zeniths,azimuths,x,y)
+	hf,zeniths,azimuths,x,y=frame_cache[('grid',gridname)]
+	if ('variable',gridname,varname) not in frame_cache:
+		try:
+			attrib_elements=domain.find("*[@Name='"+gridname+"']/*[@Name='"+varname+"']/").getchildren()
+			datapath=attrib_elements[1].text.split(':')[1]
+		except AttributeError:
+			eprint("Error: Invalid attribute")
+			eprint("\t"+settings.variable+" not found in "+file)
+			eprint("\tPath looked for was: "+gridname+"/"+varname)
+			sys.exit()
+		if attrib_elements[0].get('Dimensions'):
+			ssc=[]
+			arrsize=int(attrib_elements[0].get('Dimensions').split()[1])
+			for i in range(0,3):
+				a=[]
+				for j in range(0,arrsize):
+					a.append(int(attrib_elements[0].text.split()[j+arrsize*i]))
+				ssc.append(a)
+		else:
+			eprint('Error: Dimensions spec of dataitem in hyperslab invalid ')
+			sys.exit()
+		start=[]
+		stride=[]
+		end=[]
+		for i,j,k in zip(ssc[0],ssc[1],ssc[2]): 
+			start.append(i)
+			stride.append(j)
+			end.append(i+j*k)
+		if re.search('xn_c',datapath): # in case it's abundance stuff and needs an extra dimension specified for the xn_c grid
+			variable=hf[datapath][start[0]:end[0]:stride[0],start[1]:end[1]:stride[1],start[2]:end[2]:stride[2],start[3]:end[3]:stride[3]]
+		else:
+			variable=hf[datapath][start[0]:end[0]:stride[0],start[1]:end[1]:stride[1],start[2]:end[2]:stride[2]]
+		variable=variable.squeeze() #remove dimensions of size 1 so the result is a 2d array
+		frame_cache[('variable',gridname,varname)]=variable
+	variable=frame_cache[('variable',gridname,varname)]
 
 	# Get Creation time
 	try:
@@ -425,102 +451,113 @@ for file in args.files:
 	
 	#The following branch will generate a line graph of the shock radius when enabled
 	if settings.shock_enabled:
-                plt.subplot(111)
-                try:
-                        theta = np.array(hf['/mesh/y_ef'][:])
-                        r = np.empty(theta.size)
-                        r[0:theta.size-1] = np.array(hf['analysis/r_shock'][0][:])
-                        r[-1] = r[-2]
-                except KeyError as e:
-                        eprint(e)
-                        eprint('Invalid pathway to data in h5 file.')
-                        sys.exit()
-		for num, arr_val in enumerate(theta):
-                        r[num], theta[num] = pol2cart(r[num], arr_val)
-		maximum = 0
-		for num, arr_val in enumerate(r):
-			if num == 0:
-				maximum = abs(arr_val)
-                        if arr_val > maximum:
-                                maximum = abs(arr_val)
-		i = 0
-		while maximum / 10 > 1:
-                        maximum = maximum/10
-                        i += 1
-                swr_cont = np.empty(1)
-                swt_cont = np.empty(1)
-                for num, arr_val in enumerate(r):
-                    if np.sqrt(arr_val**2 + theta[num]**2)<1*10**i and np.sqrt(arr_val**2 + theta[num]**2)>1*10**(i-1):
-                        pass
-                    elif np.sqrt(arr_val**2 + theta[num]**2)<1*10**(i-1):
-                        pass
-                    else:
-                        swr_cont = np.append(swr_cont, arr_val)
-                        swt_cont = np.append(swt_cont, theta[num])
-
-                plt.plot(swr_cont[1:]/1e5, swt_cont[1:]/1e5, c = settings.shock_line_color, linestyle = settings.shock_linestyle,\
-                         linewidth = settings.shock_line_width, zorder = 6, label = 'Shock Radius')
+		plt.subplot(111)
+		if 'shock' not in frame_cache:
+			try:
+				theta = np.array(hf['/mesh/y_ef'][:])
+				r = np.empty(theta.size)
+				r[0:theta.size-1] = np.array(hf['analysis/r_shock'][0][:])
+				r[-1] = r[-2]
+			except KeyError as e:
+				eprint(e)
+				eprint('Invalid pathway to data in h5 file.')
+				sys.exit()
+			for num, arr_val in enumerate(theta):
+				r[num], theta[num] = pol2cart(r[num], arr_val)
+			maximum = 0
+			for num, arr_val in enumerate(r):
+				if num == 0:
+					maximum = abs(arr_val)
+				if arr_val > maximum:
+					maximum = abs(arr_val)
+			i = 0
+			while maximum / 10 > 1:
+				maximum = maximum/10
+				i += 1
+			swr_cont = np.empty(1)
+			swt_cont = np.empty(1)
+			for num, arr_val in enumerate(r):
+				if np.sqrt(arr_val**2 + theta[num]**2)<1*10**i and np.sqrt(arr_val**2 + theta[num]**2)>1*10**(i-1):
+					pass
+				elif np.sqrt(arr_val**2 + theta[num]**2)<1*10**(i-1):
+					pass
+				else:
+					swr_cont = np.append(swr_cont, arr_val)
+					swt_cont = np.append(swt_cont, theta[num])
+			frame_cache['shock'] = (swr_cont[1:]/1e5, swt_cont[1:]/1e5)
+		swr_cont, swt_cont = frame_cache['shock']
+		plt.plot(swr_cont, swt_cont, c = settings.shock_line_color, linestyle = settings.shock_linestyle,\
+			linewidth = settings.shock_line_width, zorder = 6, label = 'Shock Radius')
 	#The following branch will display the nse_c contour plot when enabled
-        if settings.nse_c_contour:
-                plt.subplot(111)
-                try:
-                        phi1 = np.array(hf['/mesh/y_ef'][:])
-                        rho1 = np.array(hf['/mesh/x_ef'][:])
-                        data = np.array(hf['abundance/nse_c'][:])
-                except KeyError as e:
-                        eprint(e)
-                        eprint('Invalid pathway to data in h5 file.')
-                        sys.exit()
-
-                data = data.reshape(phi1.size-1,rho1.size)      #Takes the 1xXxY data set form the h5 file and transforms into a 2D matrix
-                data2 = np.zeros((phi1.size, rho1.size))        #Initializes an array of zeros to be filled for the purpose of adding a row
-                data2[0:phi1.size-1] = data                     #Takes the data and fills it into the previously initialized array
-                data2[phi1.size-1]=data[phi1.size-2]            #Copies the last row of data into the last row of data2 to control for dimension mismatch
-
-                rho1, phi1 = np.meshgrid(rho1, phi1)            
-                var1, var2 = pol2cart(rho1, phi1)
-                bounds = np.linspace(0,1,1)
-
-                nse_c = plt.contour(var1/1e5, var2/1e5, data2, levels = bounds, cmap=settings.nse_cmap,\
-                                    zorder = 3, linewidths = settings.nse_c_line_widths, linestyles=settings.nse_c_linestyles)
+	if settings.nse_c_contour:
+		plt.subplot(111)
+		if 'nse_c' not in frame_cache:
+			try:
+				phi1 = np.array(hf['/mesh/y_ef'][:])
+				rho1 = np.array(hf['/mesh/x_ef'][:])
+				data = np.array(hf['abundance/nse_c'][:])
+			except KeyError as e:
+				eprint(e)
+				eprint('Invalid pathway to data in h5 file.')
+				sys.exit()
+
+			data = data.reshape(phi1.size-1,rho1.size)	#Takes the 1xXxY data set form the h5 file and transforms into a 2D matrix
+			data2 = np.zeros((phi1.size, rho1.size))	#Initializes an array of zeros to be filled for the purpose of adding a row
+			data2[0:phi1.size-1] = data			#Takes the data and fills it into the previously initialized array
+			data2[phi1.size-1]=data[phi1.size-2]		#Copies the last row of data into the last row of data2 to control for dimension mismatch
+
+			rho1, phi1 = np.meshgrid(rho1, phi1)
+			var1, var2 = pol2cart(rho1, phi1)
+			frame_cache['nse_c'] = (var1/1e5, var2/1e5, data2)
+		var1, var2, data2 = frame_cache['nse_c']
+		bounds = np.linspace(0,1,1)
+
+		nse_c = plt.contour(var1, var2, data2, levels = bounds, cmap=settings.nse_cmap,\
+			zorder = 3, linewidths = settings.nse_c_line_widths, linestyles=settings.nse_c_linestyles)
 	#The following branch will print a label corresponding to the shock radius line. If the shock radius is not enabled a warning is output
-        if settings.legend_enabled:
-                if settings.shock_enabled:
-                        plt.legend()
-                else:
-                        qprint("No legend to print. The schock wave radius is not enabled")
+	if settings.legend_enabled:
+		if settings.shock_enabled:
+			plt.legend()
+		else:
+			qprint("No legend to print. The schock wave radius is not enabled")
 	#The following branch will overlay a scatter plot of tracer particles
-        if settings.particle_overlay:
-                plt.subplot(111)
-                try:
-                        px = np.array(hf['/particle/px'])
-                        py = np.array(hf['/particle/py'])
-                        #pz = np.array(h5file['/particle/pz'])
-                except KeyError as e:
-                        eprint('Particle data could no be found')
-                        sys.exit()
-                px, py = pol2cart(px, py)
-                if settings.particle_numbers:
-                        qprint('NOTICE: Printing particles as numbers will take some time')
-                        for num in range(px.size):
-                                plt.text(px[num]/1e5, py[num]/1e5, str(num), size = settings.particle_num_size, color = settings.particle_color)
-                else:
-                        particles = plt.scatter(px/1e5, py/1e5, s = settings.particle_size, color = settings.particle_color, zorder = 5)
+	if settings.particle_overlay:
+		plt.subplot(111)
+		if 'particles' not in frame_cache:
+			try:
+				px = np.array(hf['/particle/px'])
+				py = np.array(hf['/particle/py'])
+				#pz = np.array(h5file['/particle/pz'])
+			except KeyError as e:
+				eprint('Particle data could no be found')
+				sys.exit()
+			px, py = pol2cart(px, py)
+			frame_cache['particles'] = (px/1e5, py/1e5)
+		px, py = frame_cache['particles']
+		if settings.particle_numbers:
+			qprint('NOTICE: Printing particles as numbers will take some time')
+			for num in range(px.size):
+				plt.text(px[num], py[num], str(num), size = settings.particle_num_size, color = settings.particle_color)
+		else:
+			particles = plt.scatter(px, py, s = settings.particle_size, color = settings.particle_color, zorder = 5)
 	#The following code overlays a 2-D shock contour
-        if settings.shock_contour_enabled:
-                plt.subplot(111)
-                try:
-                        rad = np.array(hf['/mesh/x_ef'][:])
-                        tht = np.array(hf['/mesh/y_ef'][:])
-                        f = np.array(hf['/fluid/shock'][:])
-                except KeyError as e:
-                        qprint("Shock data could not be found")
-                        sys.exit()
-                rad, tht = np.meshgrid(rad, tht)
-                var_r, var_t = pol2cart(rad, tht)
-                bds = np.linspace(0,1,2)
-                plt.contour(var_r/1e5, var_t/1e5, f, cmap=settings.shock_contour_cmap, levels = bds, zorder = 5, \
-                        linewidths = settings.shock_contour_line_widths, linestyles=settings.shock_contour_style)
+	if settings.shock_contour_enabled:
+		plt.subplot(111)
+		if 'shock_contour' not in frame_cache:
+			try:
+				rad = np.array(hf['/mesh/x_ef'][:])
+				tht = np.array(hf['/mesh/y_ef'][:])
+				f = np.array(hf['/fluid/shock'][:])
+			except KeyError as e:
+				qprint("Shock data could not be found")
+				sys.exit()
+			rad, tht = np.meshgrid(rad, tht)
+			var_r, var_t = pol2cart(rad, tht)
+			frame_cache['shock_contour'] = (var_r/1e5, var_t/1e5, f)
+		var_r, var_t, f = frame_cache['shock_contour']
+		bds = np.linspace(0,1,2)
+		plt.contour(var_r, var_t, f, cmap=settings.shock_contour_cmap, levels = bds, zorder = 5, \
+			linewidths = settings.shock_contour_line_widths, linestyles=settings.shock_contour_style)
 
 	# # Setup mouse-over string to interrogate data interactively when in polar coordinates
 	# def format_coord(x, y):
@@ -584,31 +621,37 @@ for file in args.files:
 	hot_desaturated_r=LinearSegmentedColormap('hot_desaturated_r',cdict_r,N=256,gamma=1.0)
 
 	del cdict,cdict_r
+	# plt.get_cmap hands back the shared registered colormap, so copy it before set_over/set_under/set_bad below
+	# or those colors leak into every later render that uses the same cmap
+	if settings.cmap=='hot_desaturated':
+		cmap=hot_desaturated
+	else:
+		cmap=copy.deepcopy(plt.get_cmap(settings.cmap)) # deepcopy: a shallow copy shares the lookup table that set_over etc. write into
 	if settings.cbar_scale=='log':
 		norm=LogNorm()
 	else:
 		norm=None
 	if settings.cbar_domain_min=='auto' and settings.cbar_domain_max=='auto':
-		pcolor=sp.pcolormesh(x, y, variable,cmap=[hot_desaturated,settings.cmap][settings.cmap!='hot_desaturated'],norm=norm,antialiased=settings.smooth_zones)
+		pcolor=sp.pcolormesh(x, y, variable,cmap=cmap,norm=norm,antialiased=settings.smooth_zones)
 	else:
-		pcolor=sp.pcolormesh(x, y, variable,cmap=[hot_desaturated,settings.cmap][settings.cmap!='hot_desaturated'],norm=norm,vmin=settings.cbar_domain_min,vmax=settings.cbar_domain_max,antialiased=settings.smooth_zones)
+		pcolor=sp.pcolormesh(x, y, variable,cmap=cmap,norm=norm,vmin=settings.cbar_domain_min,vmax=settings.cbar_domain_max,antialiased=settings.smooth_zones)
 
 	if settings.cbar_over_color=='background':
-		pcolor.cmap.set_over(color=settings.background_color, alpha=None)
+		cmap.set_over(color=settings.background_color, alpha=None)
 		print('Using over color: background')
 	elif settings.cbar_over_color:
-		pcolor.cmap.set_over(color=settings.cbar_over_color, alpha=None)
+		cmap.set_over(color=settings.cbar_over_color, alpha=None)
 		print('Using over color:',settings.cbar_over_color)
 
 	if settings.cbar_under_color=='background':
-		pcolor.cmap.set_under(color=settings.background_color, alpha=None)
+		cmap.set_under(color=settings.background_color, alpha=None)
 		print('Using under color: background')
 	elif settings.cbar_under_color:
-		pcolor.cmap.set_under(color=settings.cbar_under_color, alpha=None)
+		cmap.set_under(color=settings.cbar_under_color, alpha=None)
 		print('Using under color:',settings.cbar_under_color)
 
 	if settings.cbar_bad_color:
-		pcolor.cmap.set_bad(color=settings.cbar_bad_color, alpha=None)
+		cmap.set_bad(color=settings.cbar_bad_color, alpha=None)
 		print('Using bad color:',settings.cbar_bad_color)
 
 	for atr in ['title','x_range_label','y_range_label']:
@@ -658,3 +701,4 @@ for file in args.files:
 			call(['qlmanage -p '+directory+'/'+image_name+' &> /dev/null'],shell=True) # for on-the-fly lightning fast image viewing on mac
 		else:
 			plt.show() #Built in interactive viewer for non-macOS platforms. Slower.
+	plt.close(fig) # free the figure before the next render, otherwise every settings file x frame combination stays in memory